@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Describe: 告警快速通道，聚合完成后按阈值规则直接推送飞书卡片，不等待 AI 分析
+
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from feishu_api import FSMsgHandler
+
+logger = logging.getLogger(__name__)
+
+# 级别从高到低
+LEVELS = ["P0", "P1", "P2", "P3", "P4"]
+# 需要电话加急的级别
+URGENT_LEVELS = ["P0", "P1"]
+
+METRIC_NAMES = {"total": "总事件数", "task": "任务", "user": "用户", "ip_prefix": "IP"}
+
+
+def evaluate(rules: List[Dict], current: Dict[str, Dict[str, int]],
+             comparison: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    按阈值规则检查聚合结果
+    :param rules: 规则列表，字段:
+        name: 规则名称
+        metric: total / task / user / ip_prefix
+        value: 只检查指定取值（可选）
+        threshold: 事件数下限（可选）
+        ratio: 相对历史日均值的倍数下限（可选，需要启用历史聚合存储）
+        baseline_days: ratio 使用的基线天数，默认 7
+        level: P0-P4，默认 P2
+    :param current: {维度: {取值: 当前事件数}}
+    :param comparison: RollupStore.compare 的结果
+    :return: 命中列表
+    """
+    baselines = {
+        (item["dimension"], str(item["value"])): item["baselines"]
+        for item in comparison or []
+    }
+
+    hits = []
+    for rule in rules:
+        threshold = rule.get("threshold")
+        ratio = rule.get("ratio")
+        if threshold is None and ratio is None:
+            logger.warning(f"规则未配置 threshold 或 ratio，已忽略: {rule}")
+            continue
+        level = rule.get("level", "P2")
+        if level not in LEVELS:
+            logger.warning(f"规则级别 {level} 无效，应为 {LEVELS} 之一，按 P2 处理: {rule}")
+            level = "P2"
+
+        for value, count in current.get(rule.get("metric"), {}).items():
+            if "value" in rule and str(rule["value"]) != str(value):
+                continue
+            if threshold is not None and count < threshold:
+                continue
+
+            baseline = None
+            if ratio is not None:
+                days = rule.get("baseline_days", 7)
+                window = baselines.get((rule["metric"], str(value)), {})
+                # 经过中间数据序列化后天数会变成字符串
+                average, observed = window.get(days) or window.get(str(days)) or (0.0, 0)
+                if not observed:
+                    continue
+                if average and count / average < ratio:
+                    continue
+                baseline = (days, average)
+
+            hits.append({
+                "rule": rule.get("name", rule["metric"]),
+                "metric": rule["metric"],
+                "value": value,
+                "count": count,
+                "baseline": baseline,
+                "level": level,
+            })
+    return hits
+
+
+def should_alert(hit: Dict, last: Optional[Dict], cooldown: int, now: datetime = None) -> bool:
+    """
+    冷却时间内同一规则、同一取值不重复告警，级别升高时除外
+    :param last: 上一次告警 {"level", "alerted_at"}
+    :param cooldown: 冷却时间（分钟）
+    """
+    if not last or not cooldown:
+        return True
+    if LEVELS.index(hit["level"]) < LEVELS.index(last["level"]):
+        return True
+    now = now or datetime.now()
+    return now - last["alerted_at"] >= timedelta(minutes=cooldown)
+
+
+def highest_level(hits: List[Dict]) -> str:
+    return min((hit["level"] for hit in hits), key=LEVELS.index)
+
+
+def format_hits(hits: List[Dict]) -> str:
+    lines = []
+    for hit in sorted(hits, key=lambda item: LEVELS.index(item["level"])):
+        label = METRIC_NAMES.get(hit["metric"], hit["metric"])
+        if hit["metric"] != "total":
+            label = f"{label} {hit['value']}"
+        line = f"- **[{hit['level']}] {hit['rule']}**: {label} 事件数 {hit['count']}"
+        if hit["baseline"]:
+            days, average = hit["baseline"]
+            line += f"，近{days}天日均 {average:.1f}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def send_early_alert(hits: List[Dict], feishu_config: Dict, urgent_project: str = None) -> Dict:
+    """
+    推送快速告警卡片，P0/P1 同时电话加急
+    :return: {"level": 级别, "msg_id": 消息ID, "hits": 命中规则的文本}，AI 报告生成后用于更新同一张卡片
+    """
+    level = highest_level(hits)
+    hits_text = format_hits(hits)
+    fs_handler = FSMsgHandler(
+        app_id=feishu_config['app_id'],
+        app_secret=feishu_config['app_secret'],
+        default_chat_id=feishu_config['chat_id'],
+        user_emails_map=feishu_config.get('user_emails_map', {})
+    )
+    msg = f"{hits_text}\n\nAI 分析报告生成中，完成后将更新此卡片。"
+    msg_id = fs_handler.alert(msg=msg, chat_id=feishu_config['chat_id'], level=level)
+    logger.info(f"快速告警已发送，级别: {level}, 消息ID: {msg_id}")
+
+    # 卡片已发出，电话加急失败不影响返回结果
+    if level in URGENT_LEVELS:
+        try:
+            fs_handler.send_urgent_phone(msg_id, urgent_project)
+        except Exception as e:
+            logger.error(f"电话加急失败，消息ID: {msg_id}, 错误: {str(e)}")
+    return {"level": level, "msg_id": msg_id, "hits": hits_text}
@@ -35,7 +35,7 @@ class FSAPI(object):
         url = "https://open.feishu.cn/open-apis/message/v4/send/?receive_id_type=chat_id"
         payload = json.dumps({
             "msg_type": "interactive",
-            "update_multi": False,
+            "update_multi": True,
             "card": card,
             "chat_id": chat_id,
             "uuid": str(round(time.time(), 0))
@@ -50,6 +50,19 @@ class FSAPI(object):
             time.sleep(i + 1)
         return response["data"]["message_id"]
 
+    def update_msg(self, msg_id, card):
+        url = f"https://open.feishu.cn/open-apis/im/v1/messages/{msg_id}"
+        payload = json.dumps({
+            "content": json.dumps(card)
+        })
+        logging.info(f"update_msg payload:{payload}")
+        response = requests.request("PATCH", url, headers=self.headers, data=payload).json()
+        if response['code'] != 0:
+            msg = f"update msg fail:{response}"
+            logging.error(msg)
+            raise Exception(msg)
+        return response
+
     def urgent_phone(self, msg_id, user_id_list, user_id_type="open_id"):
         url = f"https://open.feishu.cn/open-apis/im/v1/messages/{msg_id}/urgent_phone?user_id_type={user_id_type}"
         payload = json.dumps({
@@ -125,21 +138,22 @@ class FSMsgHandler(FSAPI):
                 logging.error(f"email:{item['email']} not found!")
         return self.urgent_phone(msg_id, user_openid_list)
 
-    def alert(self, msg, chat_id):
+    def build_card(self, msg, level=None):
         template_color = {
-            "P0": "grey",
+            "P0": "carmine",
             "P1": "red",
             "P2": "orange",
             "P3": "purple",
             "P4": "blue"
         }
 
-        title = f"安全运营报告"
-        color = "green"
+        title = f"安全运营报告 {level}" if level else "安全运营报告"
+        color = template_color.get(level, "green")
 
         data = {
             "config": {
-                "wide_screen_mode": True
+                "wide_screen_mode": True,
+                "update_multi": True
             },
             "elements": [{
                 "tag": "markdown",
@@ -171,4 +185,15 @@ class FSMsgHandler(FSAPI):
                 }
             }
         }
-        return self.send_msg(card=data, chat_id=chat_id)
+        return data
+
+    def alert(self, msg, chat_id, level=None):
+        return self.send_msg(card=self.build_card(msg, level), chat_id=chat_id)
+
+    def update_alert(self, msg_id, msg, level=None):
+        """
+        更新已发送的告警卡片
+        :param msg_id: 消息ID
+        :param level: 告警级别，决定卡片颜色
+        """
+        return self.update_msg(msg_id, card=self.build_card(msg, level))
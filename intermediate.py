@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Describe: 处理器与 AI 分析之间的中间数据格式
+#
+# 文件结构（小端序）:
+#   MAGIC(4 字节) | 版本号(uint16) | 记录 1 | 记录 2 | ...
+#   每条记录: 长度(uint32) | UTF-8 JSON
+# 记录带长度前缀，读取时通过 mmap 按需解码，不需要的记录可以直接跳过。
+
+import os
+import mmap
+import json
+import fcntl
+import struct
+import logging
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List
+
+from rollup_store import format_comparison
+
+logger = logging.getLogger(__name__)
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+MAGIC = b"AIOD"
+VERSION = 1
+HEADER = struct.Struct("<4sH")
+LENGTH = struct.Struct("<I")
+
+
+def is_intermediate(path: str) -> bool:
+    """判断文件是否为中间数据格式"""
+    if not os.path.exists(path) or os.path.getsize(path) < HEADER.size:
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def to_record(data: Dict, project: str = None) -> Dict:
+    """将 compress_logs 的统计结果转换为可序列化的记录"""
+    return {
+        "project": project,
+        "generated_at": datetime.now().strftime(TIME_FORMAT),
+        "search": data.get("search"),
+        "total_events": data["total_events"],
+        "task_counts": dict(data["task_counts"]),
+        "by_from": {source: dict(counter) for source, counter in data["by_from"].items()},
+        "user_counts": [list(item) for item in data["user_counts"]],
+        "ip_prefixes": [list(item) for item in data["ip_prefixes"]],
+        "baseline": data.get("baseline"),
+        # 快速告警: {"level", "msg_id", "hits": 命中规则的文本}，AI 报告生成后据此更新卡片
+        "alert": {
+            "level": data["alert"]["level"],
+            "msg_id": data["alert"]["msg_id"],
+            "hits": data["alert"]["hits"],
+        } if data.get("alert") else None,
+    }
+
+
+def dump(path: str, records: List[Dict]) -> None:
+    """写入中间数据文件（先写同目录下的临时文件再替换，避免读取到写了一半的文件）"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION))
+            for record in records:
+                payload = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                f.write(LENGTH.pack(len(payload)))
+                f.write(payload)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def locked(path: str):
+    """对中间数据文件加排他锁，多个处理器共用同一文件时串行读写"""
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def append(path: str, record: Dict) -> None:
+    """
+    写入一条记录，替换文件中同一项目的旧记录，其他项目的记录保留
+    每个项目只保留最近一次采集的结果，多项目可共用同一个文件
+    """
+    with locked(path):
+        records = []
+        if is_intermediate(path):
+            records = [item for item in iter_records(path) if item.get("project") != record.get("project")]
+        records.append(record)
+        dump(path, records)
+
+
+def clear_alert(path: str, project: str, msg_id: str) -> None:
+    """AI 报告已更新到快速告警卡片后清除告警，避免后续运行重复更新同一张卡片"""
+    with locked(path):
+        if not is_intermediate(path):
+            return
+        records = load(path)
+        for record in records:
+            alert = record.get("alert")
+            # 只清除同一张卡片，期间新一轮处理写入的告警保留
+            if record.get("project") == project and alert and alert.get("msg_id") == msg_id:
+                record["alert"] = None
+        dump(path, records)
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    """通过 mmap 逐条读取记录"""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        magic, version = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是中间数据文件: {path}")
+        if version > VERSION:
+            raise ValueError(f"不支持的中间数据版本: {version}, 当前支持: {VERSION}")
+
+        offset = HEADER.size
+        while offset < len(mm):
+            if offset + LENGTH.size > len(mm):
+                raise ValueError(f"中间数据文件已损坏: {path}")
+            (length,) = LENGTH.unpack_from(mm, offset)
+            offset += LENGTH.size
+            if offset + length > len(mm):
+                raise ValueError(f"中间数据文件已损坏: {path}")
+            yield json.loads(mm[offset:offset + length])
+            offset += length
+
+
+def load(path: str) -> List[Dict]:
+    return list(iter_records(path))
+
+
+def is_expired(record: Dict, max_age_hours: float, now: datetime = None) -> bool:
+    """记录生成时间超过 max_age_hours 视为过期，没有 generated_at 的旧记录同样视为过期"""
+    if not max_age_hours:
+        return False
+    if not record.get("generated_at"):
+        return True
+    now = now or datetime.now()
+    age = now - datetime.strptime(record["generated_at"], TIME_FORMAT)
+    return age.total_seconds() > max_age_hours * 3600
+
+
+def render(record: Dict) -> str:
+    """将记录渲染为 prompt 使用的文本"""
+    text = f"""
+源数据:
+- 项目: {record.get('project')}
+- 生成时间: {record.get('generated_at')}
+- 查询条件: {record.get('search')}
+- 总事件数: {record['total_events']}
+- 任务分布: {record['task_counts']}
+- 来源分布: {record['by_from']}
+- 用户统计: {[tuple(item) for item in record['user_counts']]}
+- 前10个IP前缀: {[tuple(item) for item in record['ip_prefixes']]}"""
+    if record.get("baseline"):
+        text += f"""
+- 历史基线对比:
+{format_comparison(record['baseline'])}"""
+    return text
@@ -5,9 +5,10 @@ import json
 from datetime import datetime
 import logging
 import argparse
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor
 from feishu_api import FSMsgHandler
+import intermediate
 import os
 
 # 配置日志
@@ -47,18 +48,36 @@ def load_config(config_path: str = "config.yaml") -> Dict[str, Any]:
     except Exception as e:
         raise Exception(f"加载配置文件失败: {str(e)}")
 
-# 1. 读取日志
-def load_logs(log_path: str) -> List[str]:
+# 1. 读取日志，返回日志行和每条记录对应的快速告警（未告警为 None）
+def load_logs(log_path: str, max_age_hours: float = None) -> Tuple[List[str], List[Dict]]:
     try:
         if not os.path.exists(log_path):
             raise FileNotFoundError(f"日志文件不存在: {log_path}")
+
+        # 处理器输出的中间数据，每个项目一条记录，渲染为文本
+        if intermediate.is_intermediate(log_path):
+            return load_records(log_path, max_age_hours)
             
         with open(log_path, "r", encoding="utf-8") as f:
             logs = f.readlines()
-        return logs
+        return logs, []
     except Exception as e:
         raise Exception(f"读取日志文件失败: {str(e)}")
 
+def load_records(log_path: str, max_age_hours: float = None) -> Tuple[List[str], List[Dict]]:
+    # 告警与日志在同一次读取中获取，避免AI分析期间文件被新一轮处理覆盖
+    logs = []
+    alerts = []
+    for record in intermediate.iter_records(log_path):
+        # 已停止运行的项目不再输出到 prompt
+        if intermediate.is_expired(record, max_age_hours):
+            logging.warning(f"中间数据已过期，跳过: {record.get('project')}, 生成时间: {record.get('generated_at')}")
+            continue
+        logs.extend(intermediate.render(record).splitlines(keepends=True))
+        alert = record.get('alert')
+        alerts.append(dict(alert, project=record.get('project')) if alert else None)
+    return logs, alerts
+
 # 2. 预处理日志
 def preprocess_logs(logs: List[str]) -> List[str]:
     try:
@@ -94,6 +113,8 @@ def load_prompt_template(prompt_path: str) -> str:
 # 4. 构建prompt
 def build_prompt(template: str, logs: List[str]) -> str:
     try:
+        if len(logs) > 100:
+            logging.warning(f"日志共 {len(logs)} 行，超出限制，只保留前 100 行")
         logs_text = "\n".join(logs[:100])  # 限制日志数量，避免超出token限制
         prompt = template.replace("{{logs}}", logs_text)
         return prompt
@@ -178,7 +199,8 @@ def generate_report(model_result: str) -> str:
         raise Exception(f"生成报告失败: {str(e)}")
 
 # 7. 发送通知
-def send_fs_notice(context: str, config: Dict[str, Any], logger: logging.Logger) -> None:
+def send_fs_notice(context: str, config: Dict[str, Any], logger: logging.Logger,
+                   alerts: List[Optional[Dict]] = None) -> None:
     try:
         from feishu_api import FSMsgHandler
         
@@ -190,6 +212,32 @@ def send_fs_notice(context: str, config: Dict[str, Any], logger: logging.Logger)
             user_emails_map=config['notification']['feishu'].get('user_emails_map', {})
         )
         
+        # 处理器已通过快速通道发送告警时，更新同一张卡片，保留命中的规则
+        alerts = alerts or []
+        for alert in filter(None, alerts):
+            msg = f"{alert['hits']}\n\n{context}"
+            try:
+                fs_handler.update_alert(msg_id=alert['msg_id'], msg=msg, level=alert['level'])
+                logger.info(f"飞书通知已更新，消息ID: {alert['msg_id']}")
+            except Exception as e:
+                logger.error(f"更新飞书通知失败，改为发送新消息: {str(e)}")
+                msg_id = fs_handler.alert(
+                    msg=msg,
+                    chat_id=config['notification']['feishu']['chat_id'],
+                    level=alert['level']
+                )
+                logger.info(f"飞书通知发送成功，消息ID: {msg_id}")
+
+            # 告警只对应本轮处理，更新后清除，之后的运行按普通通知发送
+            try:
+                intermediate.clear_alert(config['files']['log_path'], alert['project'], alert['msg_id'])
+            except Exception as e:
+                logger.error(f"清除已处理的快速告警失败: {str(e)}")
+
+        # 卡片更新不会提醒，只要有记录没有快速告警，就另外发送新消息
+        if alerts and all(alerts):
+            return
+
         # 发送告警消息
         msg_id = fs_handler.alert(
             msg=context,
@@ -223,7 +271,7 @@ def main():
         logger.info("开始处理数据")
         
         # 读取和预处理日志
-        logs = load_logs(config['files']['log_path'])
+        logs, alerts = load_logs(config['files']['log_path'], config['files'].get('record_max_age'))
         cleaned_logs = preprocess_logs(logs)
         
         # 构建prompt
@@ -237,7 +285,7 @@ def main():
         report = generate_report(model_result)
         
         # 发送通知
-        send_fs_notice(report, config, logger)
+        send_fs_notice(report, config, logger, alerts)
         
         logger.info("安全告警分析完成")
         
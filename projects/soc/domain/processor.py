@@ -6,6 +6,9 @@ from datetime import datetime, timedelta
 import re
 import json
 from collections import Counter, defaultdict
+from rollup_store import open_store
+import intermediate
+import early_alert
 
 logger = logging.getLogger(__name__)
 
@@ -97,6 +100,101 @@ class DomainProcessor:
             "user_counts": user_counter.most_common(10),
             "ip_prefixes": ip_prefix_counter.most_common(10)
         }
+
+    def current_counts(self, data: Dict) -> Dict[str, Dict]:
+        """按维度整理当前窗口的统计结果"""
+        return {
+            "total": {"": data['total_events']},
+            "task": dict(data['task_counts']),
+            "user": dict(data['user_counts']),
+            "ip_prefix": dict(data['ip_prefixes'])
+        }
+
+    def alert(self, data: Dict) -> Optional[Dict]:
+        """按阈值规则检查聚合结果，命中时立即推送飞书告警，不等待AI分析"""
+        alert_config = self.config.get('processor', {}).get('alert', {})
+        rules = alert_config.get('rules', [])
+        if not rules:
+            logger.info("快速告警未配置规则")
+            return None
+
+        hits = early_alert.evaluate(rules, self.current_counts(data), data.get('baseline'))
+        if not hits:
+            logger.info("快速告警规则未命中")
+            return None
+
+        # 告警失败不影响后续的AI分析和通知
+        store = None
+        try:
+            project = self.config.get('processor', {}).get('project', 'default')
+            now = datetime.now()
+
+            # 采集窗口为滚动的24小时，同一事件会被多次采集，冷却时间内不重复告警
+            store = open_store(self.config.get('processor', {}).get('rollup', {}))
+            if store:
+                cooldown = alert_config.get('cooldown', 0)
+                hits = [hit for hit in hits if early_alert.should_alert(
+                    hit, store.last_alert(project, hit['rule'], hit['value']), cooldown, now)]
+                if not hits:
+                    logger.info("快速告警命中的规则均在冷却时间内")
+                    return None
+            else:
+                logger.warning("历史聚合存储未启用，快速告警不做冷却判断")
+
+            with open(alert_config.get('notification_config', 'config.yaml'), 'r', encoding='utf-8') as f:
+                feishu_config = yaml.safe_load(f)['notification']['feishu']
+            result = early_alert.send_early_alert(hits, feishu_config, alert_config.get('urgent_project'))
+        except Exception as e:
+            logger.error(f"快速告警发送失败: {str(e)}")
+            if store:
+                store.close()
+            return None
+
+        # 卡片已发出，记录冷却失败时也要返回消息ID，AI 报告生成后据此更新卡片
+        try:
+            if store:
+                store.record_alerts(project, hits, now)
+        except Exception as e:
+            logger.error(f"记录快速告警失败: {str(e)}")
+        finally:
+            if store:
+                store.close()
+        return result
+
+    def rollup(self, logs: List[Dict], data: Dict) -> Optional[List[Dict]]:
+        """写入本地历史聚合存储，并返回与近期基线的对比结果"""
+        rollup_config = self.config.get('processor', {}).get('rollup', {})
+        if not rollup_config.get('db_path'):
+            logger.info("历史聚合存储未启用")
+            return None
+
+        # 基线对比是附加信息，失败时不影响后续的告警和AI分析
+        store = None
+        try:
+            store = open_store(rollup_config)
+            project = self.config.get('processor', {}).get('project', 'default')
+            window_start = datetime.strptime(
+                self.api_config.get('payload', {}).get('search', {}).get('event_time_start'),
+                "%Y-%m-%d %H:%M:%S"
+            )
+            windows = rollup_config.get('baseline_days') or [7, 30]
+            buckets, failed = store.bucket_logs(logs)
+            if failed:
+                logger.warning(f"{failed}/{len(logs)} 条日志的 event_time 无法解析，未计入历史聚合")
+            # 大部分时间无法解析时写入的数据不可信，只做基线对比
+            if failed * 2 > len(logs):
+                logger.warning("超过半数日志的 event_time 无法解析，跳过写入历史聚合")
+            else:
+                store.record(project, buckets,
+                             retention_days=rollup_config.get('retention_days', max(windows) + 2))
+            return store.compare(project, self.current_counts(data), end=window_start, windows=windows)
+        except Exception as e:
+            logger.error(f"历史聚合处理失败: {str(e)}")
+            return None
+        finally:
+            if store:
+                store.close()
+
     def deduplicate_data(self, data: List[Dict]) -> List[Dict]:
         """去重数据
         根据配置的字段进行去重处理
@@ -152,20 +250,14 @@ class DomainProcessor:
     def save(self, data: Dict) -> None:
         """保存处理后的结果"""
         try:
-            result_text = f"""
-源数据:
-- 查询条件: {self.api_config.get('payload', {}).get('search')}
-- 总事件数: {data['total_events']}
-- 任务分布: {dict(data['task_counts'])}
-- 用户统计: {data['user_counts']}
-- 前10个IP前缀: {data['ip_prefixes']}"""
+            record = intermediate.to_record(data, project=self.config.get('processor', {}).get('project'))
+            result_text = intermediate.render(record)
             output_path = self.config['processor']['output_file']
             if not output_path:
                 logger.warning("输出功能未启用")
                 return
 
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(str(result_text))
+            intermediate.append(output_path, record)
             logger.info(f"数据已保存至: {output_path}")
 
         except Exception as e:
@@ -185,8 +277,14 @@ class DomainProcessor:
             
             # 3. 压缩和统计
             compressed_data = self.compress_logs(cleaned_data)
+
+            # 4. 写入历史聚合并对比基线
+            compressed_data['baseline'] = self.rollup(cleaned_data, compressed_data)
+
+            # 5. 快速告警
+            compressed_data['alert'] = self.alert(compressed_data)
             
-            # 4. 保存结果            
+            # 6. 保存结果            
             return self.save(compressed_data)
         except Exception as e:
             logger.error(f"数据处理失败: {str(e)}")
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# @Describe: 本地历史聚合存储，按小时/天保存 compress_logs 的统计结果，用于趋势和基线对比
+
+import sqlite3
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HOUR_FORMAT = "%Y-%m-%d %H:00:00"
+DAY_FORMAT = "%Y-%m-%d"
+
+# 用户/IP 只输出变化显著的前几项，避免基线对比挤占 prompt
+SIGNIFICANT_CHANGE = 0.5
+TOP_N = 3
+
+
+class RollupStore(object):
+    """
+    基于 sqlite 的聚合存储
+    - rollup_hourly: 每小时每个维度取值的事件数
+    - rollup_daily: 由 rollup_hourly 汇总得到的每日事件数
+    同一小时被多次采集时保留较大的计数（采集窗口相互重叠，日志只增不减），因此重复运行不会重复累加。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self._init_schema()
+
+    def _init_schema(self) -> None:
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rollup_hourly (
+                bucket    TEXT    NOT NULL,
+                project   TEXT    NOT NULL,
+                dimension TEXT    NOT NULL,
+                value     TEXT    NOT NULL,
+                count     INTEGER NOT NULL,
+                PRIMARY KEY (project, dimension, value, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS rollup_daily (
+                bucket    TEXT    NOT NULL,
+                project   TEXT    NOT NULL,
+                dimension TEXT    NOT NULL,
+                value     TEXT    NOT NULL,
+                count     INTEGER NOT NULL,
+                PRIMARY KEY (project, dimension, value, bucket)
+            );
+            CREATE INDEX IF NOT EXISTS idx_rollup_hourly_bucket ON rollup_hourly (project, bucket);
+            CREATE INDEX IF NOT EXISTS idx_rollup_daily_bucket ON rollup_daily (project, bucket);
+            CREATE TABLE IF NOT EXISTS alert_history (
+                project    TEXT NOT NULL,
+                rule       TEXT NOT NULL,
+                value      TEXT NOT NULL,
+                level      TEXT NOT NULL,
+                alerted_at TEXT NOT NULL,
+                PRIMARY KEY (project, rule, value)
+            );
+        """)
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    @staticmethod
+    def parse_time(value) -> Optional[datetime]:
+        """解析事件时间，支持 "%Y-%m-%d %H:%M:%S" 和 ISO 8601，带时区的转换为本地时间"""
+        try:
+            return datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            pass
+        try:
+            event_time = datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+        if event_time.tzinfo:
+            event_time = event_time.astimezone().replace(tzinfo=None)
+        return event_time
+
+    @staticmethod
+    def bucket_logs(logs: List[Dict], time_field: str = "event_time") -> Tuple[Dict[str, Dict[str, Counter]], int]:
+        """
+        按小时对日志分桶统计
+        时间无法解析的日志不计入：每次运行的采集窗口不同，归到任意固定时间都会在多次运行间重复累加
+        :param logs: 清洗后的日志
+        :param time_field: 日志中的时间字段
+        :return: ({小时: {维度: Counter}}, 时间解析失败的日志数)
+        """
+        buckets = defaultdict(lambda: defaultdict(Counter))
+        failed = 0
+        for log in logs:
+            event_time = RollupStore.parse_time(log.get(time_field))
+            if not event_time:
+                failed += 1
+                continue
+            hour = buckets[event_time.strftime(HOUR_FORMAT)]
+            hour["total"][""] += 1
+            hour["task"][log.get("task")] += 1
+            hour["user"][log.get("username")] += 1
+            if log.get("ip_address"):
+                hour["ip_prefix"][log.get("ip_address")] += 1
+        return buckets, failed
+
+    def record(self, project: str, buckets: Dict[str, Dict[str, Counter]], retention_days: int = None) -> None:
+        """
+        写入小时聚合，并重新汇总涉及到的日聚合
+        :param retention_days: 保留天数，早于最新小时该天数的数据会被删除，为空时不清理
+        """
+        try:
+            rows = [
+                (hour, project, dimension, str(value), count)
+                for hour, dims in buckets.items()
+                for dimension, counter in dims.items()
+                for value, count in counter.items()
+            ]
+            days = sorted({hour[:10] for hour in buckets})
+            with self.conn:
+                self.conn.executemany("""
+                    INSERT INTO rollup_hourly (bucket, project, dimension, value, count)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (project, dimension, value, bucket)
+                    DO UPDATE SET count = MAX(count, excluded.count)
+                """, rows)
+                for day in days:
+                    next_day = (datetime.strptime(day, DAY_FORMAT) + timedelta(days=1)).strftime(DAY_FORMAT)
+                    self.conn.execute("""
+                        INSERT OR REPLACE INTO rollup_daily (bucket, project, dimension, value, count)
+                        SELECT substr(bucket, 1, 10), project, dimension, value, SUM(count)
+                        FROM rollup_hourly
+                        WHERE project = ? AND bucket >= ? AND bucket < ?
+                        GROUP BY project, dimension, value
+                    """, (project, day, next_day))
+                if retention_days and buckets:
+                    latest = datetime.strptime(max(buckets), HOUR_FORMAT)
+                    cutoff = latest - timedelta(days=retention_days)
+                    self.conn.execute("DELETE FROM rollup_hourly WHERE project = ? AND bucket < ?",
+                                      (project, cutoff.strftime(HOUR_FORMAT)))
+                    self.conn.execute("DELETE FROM rollup_daily WHERE project = ? AND bucket < ?",
+                                      (project, cutoff.strftime(DAY_FORMAT)))
+            logger.info(f"聚合数据已写入: {self.db_path}, 小时数: {len(buckets)}, 记录数: {len(rows)}")
+        except Exception as e:
+            logger.error(f"写入聚合数据失败: {str(e)}")
+            raise
+
+    def last_alert(self, project: str, rule: str, value: str) -> Optional[Dict]:
+        """查询同一规则、同一取值最近一次的快速告警"""
+        row = self.conn.execute("""
+            SELECT level, alerted_at FROM alert_history WHERE project = ? AND rule = ? AND value = ?
+        """, (project, rule, str(value))).fetchone()
+        if not row:
+            return None
+        return {"level": row[0], "alerted_at": datetime.strptime(row[1], "%Y-%m-%d %H:%M:%S")}
+
+    def record_alerts(self, project: str, hits: List[Dict], alerted_at: datetime) -> None:
+        """记录已发送的快速告警，用于冷却判断"""
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO alert_history (project, rule, value, level, alerted_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(project, hit["rule"], str(hit["value"]), hit["level"],
+                   alerted_at.strftime("%Y-%m-%d %H:%M:%S")) for hit in hits])
+
+    def baseline(self, project: str, dimension: str, values: List[str],
+                 end: datetime, days: int) -> Tuple[Dict[str, float], int]:
+        """
+        计算 end 之前 days 天的日均值
+        没有数据的日期按 0 计入；统计区间从第一个有记录的小时开始，避免首日只采集了部分小时时拉低均值
+        :return: ({取值: 日均事件数}, 统计天数)
+        """
+        end_time = datetime.strptime(end.strftime(DAY_FORMAT), DAY_FORMAT)
+        start_time = end_time - timedelta(days=days)
+        first_bucket = self.conn.execute("""
+            SELECT MIN(bucket) FROM rollup_hourly WHERE project = ? AND dimension = 'total'
+        """, (project,)).fetchone()[0]
+        if not first_bucket:
+            return {}, 0
+        start_time = max(start_time, datetime.strptime(first_bucket, HOUR_FORMAT))
+        observed = max((end_time - start_time).total_seconds() / 86400, 0)
+        if not observed or not values:
+            return {}, observed
+
+        start_day = start_time.strftime(DAY_FORMAT)
+        end_day = end_time.strftime(DAY_FORMAT)
+
+        placeholders = ",".join("?" * len(values))
+        rows = self.conn.execute(f"""
+            SELECT value, SUM(count) FROM rollup_daily
+            WHERE project = ? AND dimension = ? AND bucket >= ? AND bucket < ?
+              AND value IN ({placeholders})
+            GROUP BY value
+        """, (project, dimension, start_day, end_day, *[str(v) for v in values])).fetchall()
+        return {value: total / observed for value, total in rows}, observed
+
+    def compare(self, project: str, current: Dict[str, Dict[str, int]], end: datetime,
+                windows: List[int] = None) -> List[Dict]:
+        """
+        将当前窗口的统计与历史日均值对比
+        :param current: {维度: {取值: 当前事件数}}
+        :param end: 当前采集窗口的起始时间，基线只取该时间之前的数据
+        :param windows: 基线天数，默认 [7, 30]
+        :return: [{"dimension", "value", "current", "baselines": {天数: (日均值, 统计天数)}}]
+        """
+        windows = windows or [7, 30]
+        result = []
+        for dimension, counts in current.items():
+            values = [str(v) for v in counts]
+            per_window = {days: self.baseline(project, dimension, values, end, days) for days in windows}
+            for value, count in counts.items():
+                result.append({
+                    "dimension": dimension,
+                    "value": value,
+                    "current": count,
+                    "baselines": {
+                        days: (averages.get(str(value), 0.0), observed)
+                        for days, (averages, observed) in per_window.items()
+                    }
+                })
+        return result
+
+
+def is_significant(item: Dict) -> bool:
+    """任一基线窗口内新出现或变化幅度超过 SIGNIFICANT_CHANGE"""
+    for average, observed in item["baselines"].values():
+        if not observed:
+            continue
+        if not average or abs(item["current"] - average) / average >= SIGNIFICANT_CHANGE:
+            return True
+    return False
+
+
+def format_comparison(comparison: List[Dict]) -> str:
+    """
+    将基线对比结果格式化为文本
+    总事件数和任务全部输出，用户/IP 只输出变化显著且事件数最多的前 TOP_N 项
+    """
+    names = {"total": "总事件数", "task": "任务", "user": "用户", "ip_prefix": "IP"}
+    selected = []
+    significant = defaultdict(list)
+    for item in comparison:
+        if item["dimension"] in ("total", "task"):
+            selected.append(item)
+        elif is_significant(item):
+            significant[item["dimension"]].append(item)
+    for items in significant.values():
+        selected.extend(sorted(items, key=lambda item: item["current"], reverse=True)[:TOP_N])
+
+    lines = []
+    for item in selected:
+        label = names.get(item["dimension"], item["dimension"])
+        if item["dimension"] != "total":
+            label = f"{label} {item['value']}"
+        parts = [f"当前 {item['current']}"]
+        for days, (average, observed) in item["baselines"].items():
+            if not observed:
+                parts.append(f"近{days}天无历史数据")
+                continue
+            delta = f"{(item['current'] - average) / average * 100:+.1f}%" if average else "新出现"
+            parts.append(f"近{days}天日均 {average:.1f} ({delta}, 统计天数 {observed:.1f})")
+        lines.append(f"  - {label}: " + ", ".join(parts))
+    return "\n".join(lines)
+
+
+def open_store(config: Optional[Dict]) -> Optional[RollupStore]:
+    """根据配置打开聚合存储，未配置 db_path 时返回 None"""
+    if not config or not config.get("db_path"):
+        return None
+    return RollupStore(config["db_path"])